@@ -0,0 +1,136 @@
+import os
+import time
+import asyncio
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import upload_to_roboflow as up
+
+
+def _label(tmp_path, text, name="a.txt"):
+    p = tmp_path / name
+    p.write_text(text)
+    return str(p)
+
+
+@pytest.mark.parametrize("text", [
+    "0 0.5 0.5 0.1 0.1\n",
+    "0 0.5 0.5 0.1 0.1\n\n3 0 1 1 0\n",
+])
+def test_valid_yolo_txt_accepts_boxes(tmp_path, text):
+    assert up.is_valid_yolo_txt(_label(tmp_path, text))
+
+
+@pytest.mark.parametrize("text", [
+    "",                             # empty
+    "\n \n",                        # whitespace only
+    "0 1.5 0.5 0.1 0.1\n",          # coord > 1
+    "0 0.5 -0.1 0.1 0.1\n",         # coord < 0
+    "0 0.5 0.5 0.1\n",              # too few columns
+    "0 0.5 0.5 0.1 0.1 7\n",        # too many columns
+    "nan 0.5 0.5 0.1 0.1\n",        # non-finite class id
+    "inf 0.5 0.5 0.1 0.1\n",
+    "0 nan 0.5 0.1 0.1\n",          # non-finite coord
+    "# note\n0 0.5 0.5 0.1 0.1\n",  # comment lines are malformed
+])
+def test_valid_yolo_txt_rejects_malformed(tmp_path, text):
+    assert not up.is_valid_yolo_txt(_label(tmp_path, text))
+
+
+def test_valid_yolo_txt_rejects_missing(tmp_path):
+    assert not up.is_valid_yolo_txt(None)
+    assert not up.is_valid_yolo_txt(str(tmp_path / "missing.txt"))
+
+
+def test_valid_yolo_txt_whitespace_only_is_quiet(tmp_path, recwarn):
+    assert not up.is_valid_yolo_txt(_label(tmp_path, "\n"))
+    assert not [w for w in recwarn if issubclass(w.category, UserWarning)]
+
+
+def test_valid_yolo_txt_whitespace_only_threaded_leaves_filters_alone(tmp_path):
+    # The validator runs on the upload producer's thread pool; it must not touch warnings state
+    paths = [_label(tmp_path, "\n \n" if i % 2 else "0 0.5 0.5 0.1 0.1\n", name=f"{i}.txt") for i in range(400)]
+    filters_before = list(warnings.filters)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            results = list(pool.map(up.is_valid_yolo_txt, paths))
+    assert results == [i % 2 == 0 for i in range(400)]
+    assert not [w for w in caught if issubclass(w.category, UserWarning)]
+    assert warnings.filters == filters_before
+
+
+def test_valid_yolo_txt_accepts_dir_entry(tmp_path):
+    _label(tmp_path, "0 0.5 0.5 0.1 0.1\n")
+    (entry,) = os.scandir(tmp_path)
+    assert up.is_valid_yolo_txt(entry)
+
+
+def test_token_bucket_allows_burst_then_paces():
+    async def run():
+        bucket = up.TokenBucket(rate=20, burst=2)
+        t0 = time.monotonic()
+        await bucket.acquire()
+        await bucket.acquire()
+        burst_done = time.monotonic() - t0
+        for _ in range(4):
+            await bucket.acquire()
+        return burst_done, time.monotonic() - t0
+
+    burst_done, elapsed = asyncio.run(run())
+    assert burst_done < 0.05
+    # 4 tokens past the burst at 20/s -> ~0.2s
+    assert 0.18 <= elapsed < 1.0
+
+
+def test_aimd_grows_one_permit_per_window_up_to_max():
+    async def run():
+        limiter = up.AIMDLimiter(start=2, max_limit=4, grow_every=3)
+        limits = []
+        for _ in range(9):
+            await limiter.grow()
+            limits.append(limiter.limit)
+        return limits
+
+    assert asyncio.run(run()) == [2, 2, 3, 3, 3, 4, 4, 4, 4]
+
+
+def test_aimd_halves_at_most_once_per_cooldown():
+    async def run():
+        limiter = up.AIMDLimiter(start=16, max_limit=16, cooldown=60.0)
+        await limiter.shrink()
+        await limiter.shrink()
+        return limiter.limit
+
+    assert asyncio.run(run()) == 8
+
+
+def test_aimd_never_drops_below_one():
+    async def run():
+        limiter = up.AIMDLimiter(start=5, max_limit=8, cooldown=0.0)
+        for _ in range(10):
+            await limiter.shrink()
+        return limiter.limit
+
+    assert asyncio.run(run()) == 1
+
+
+def test_aimd_caps_requests_in_flight():
+    async def run():
+        limiter = up.AIMDLimiter(start=2, max_limit=8)
+        in_flight = peak = 0
+
+        async def job():
+            nonlocal in_flight, peak
+            async with limiter:
+                in_flight += 1
+                peak = max(peak, in_flight)
+                await asyncio.sleep(0.01)
+                in_flight -= 1
+
+        await asyncio.gather(*(job() for _ in range(10)))
+        return peak, limiter.in_flight
+
+    assert asyncio.run(run()) == (2, 0)
@@ -13,12 +13,16 @@ Options:
 """
 
 import os
+import errno
 import argparse
 import logging
 import shutil
 from pathlib import Path
 from datetime import datetime
 
+# Roboflow export formats that include a data.yaml (yolov8, yolov8-obb, yolov11, ...)
+YAML_FORMATS = ("yolov5", "yolov7", "yolov8", "yolov9", "yolov10", "yolov11", "yolov12")
+
 def main():
     ap = argparse.ArgumentParser(description="Download Roboflow dataset version (YOLOv8) into ./datasets/")
     ap.add_argument("--api_key", required=True, help="Roboflow API key")
@@ -65,36 +69,65 @@ def main():
             shutil.rmtree(dest_path)
         else:
             logging.info(f"Destination exists, leaving as-is: {dest_path}")
-            print_next_steps(dest_path)
+            print_next_steps(dest_path, args.format)
             return
 
     # Move the downloaded folder into datasets/
+    # os.rename is a single relink on the same filesystem; shutil.move copies everything across devices
     logging.info(f"Moving '{src_path}' -> '{dest_path}'")
-    shutil.move(str(src_path), str(dest_path))
+    try:
+        os.rename(src_path, dest_path)
+        logging.info("Moved with rename (same filesystem).")
+    except OSError as e:
+        if e.errno == errno.EXDEV:
+            # shutil copies with sendfile() on Linux and fcopyfile() on macOS; elsewhere it loops over
+            # COPY_BUFSIZE reads/writes, so use bigger chunks there for multi-MB images and weights
+            if getattr(shutil, "_USE_CP_SENDFILE", False):
+                copy_mode = "sendfile"
+            elif getattr(shutil, "_HAS_FCOPYFILE", False):
+                copy_mode = "fcopyfile"
+            else:
+                copy_mode = "4 MiB buffered"
+            logging.info(f"Destination is on another filesystem; falling back to {copy_mode} copy + delete.")
+            old_bufsize = shutil.COPY_BUFSIZE
+            shutil.COPY_BUFSIZE = 4 * 1024 * 1024
+            try:
+                shutil.move(str(src_path), str(dest_path))
+            finally:
+                shutil.COPY_BUFSIZE = old_bufsize
+        else:
+            raise
 
     # Nice extras: record a small receipt
     receipt = dest_path / "_download_receipt.txt"
-    receipt.write_text(
+    write_text(
+        receipt,
         f"workspace: {args.workspace}\n"
         f"project:   {args.project}\n"
         f"version:   {args.version}\n"
         f"format:    {args.format}\n"
-        f"when:      {datetime.now().isoformat(timespec='seconds')}\n"
+        f"when:      {datetime.now().isoformat(timespec='seconds')}\n",
     )
 
     logging.info("Download complete.")
-    print_next_steps(dest_path)
+    print_next_steps(dest_path, args.format)
 
-def print_next_steps(dest_path: Path):
-    data_yaml = dest_path / "data.yaml"
+def print_next_steps(dest_path: Path, fmt: str):
     print("\nDataset ready\n")
     print(f"Location: {dest_path}")
-    if data_yaml.exists():
+    # The format decides whether data.yaml is there (Roboflow's YOLOv5+ exports ship one); no need to stat for it
+    if fmt.startswith(YAML_FORMATS):
+        data_yaml = dest_path / "data.yaml"
         print(f"data.yaml: {data_yaml}\n")
         print("Train with YOLOv8 (example):")
         print(f" yolo detect train data='{data_yaml}' model=yolov8n.pt imgsz=1280 epochs=50 device=0\n")
     else:
-        print("Note: data.yaml not found (format might not be 'yolov8').")
+        print(f"Note: no data.yaml for format '{fmt}' (use a YOLOv5+ format to train with YOLOv8).")
+
+def write_text(path: Path, text: str):
+    """Write a small sidecar file (e.g. the download receipt) through one raw fd and a single buffered write."""
+    with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644), "w", buffering=65536) as f:
+        f.write(text)
 
 if __name__ == "__main__":
     main()
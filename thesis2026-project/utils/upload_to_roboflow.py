@@ -1,6 +1,19 @@
-import os, json, argparse, logging, time
+import os, re, json, argparse, logging, asyncio, time, heapq, fnmatch
 from pathlib import Path
-from roboflow import Roboflow
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import aiohttp
+except ImportError:
+    raise SystemExit("Missing dependency: pip install aiohttp")
+
+# orjson is optional: parses bytes directly and 2-5x faster than the stdlib
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
 
 """
 Upload pictures to Roboflow.
@@ -9,6 +22,13 @@ Usage (examples):
   poetry run python upload_to_roboflow.py --api_key "Roboflow API key" --workspace my-workspace --project my-project --run_dir "Path to run folder (…/YYYY-MM-DD/<tag>/runXX)"
 """
 
+# The REST upload endpoint takes one image per request (plus one annotate call per label) and has
+# no multi-file/zip variant, so per-request overhead is amortised by connection reuse and concurrency
+API_URL = "https://api.roboflow.com"
+
+# A YOLO label this large is malformed (~40 bytes per box)
+MAX_LABEL_BYTES = 1 << 20
+
 def infer_run_parts(run_dir: Path):
     # Expect: <out_root>/<YYYY-MM-DD>/<tag>/runXX/
     date = run_dir.parents[1].name
@@ -16,30 +36,258 @@ def infer_run_parts(run_dir: Path):
     run  = run_dir.name
     return date, tag, run
 
-def is_valid_yolo_txt(p: Path) -> bool:
-    """Return True iff file exists, non-empty, and every non-empty line is 'cls x y w h' with coords in [0,1]."""
+def is_valid_yolo_txt(p: os.DirEntry | str | None) -> bool:
+    """Return True iff file exists, non-empty, and every non-empty line is 'cls x y w h' with coords in [0,1].
+
+    Pass the scandir DirEntry when there is one: its stat result is cached on the entry and reused later.
+    """
+    if p is None:
+        return False
+    # One stat decides existence and size; empty or oversized files can't be valid, so never open them
+    try:
+        st = p.stat() if isinstance(p, os.DirEntry) else os.stat(p)
+    except OSError:
+        return False
+    if st.st_size == 0 or st.st_size > MAX_LABEL_BYTES:
+        return False
     try:
-        if not p.exists() or p.stat().st_size == 0:
+        with open(p) as f:
+            data = f.read()
+        # Whitespace-only files are rejected here so loadtxt never warns about them
+        if not data.strip():
             return False
-        ok_line = False
-        with p.open("r") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                parts = line.split()
-                if len(parts) != 5:
-                    return False
-                # class id can be int; coords must be floats in [0,1]
-                _cls = int(float(parts[0]))
-                x, y, w, h = map(float, parts[1:])
-                if not (0.0 <= x <= 1.0 and 0.0 <= y <= 1.0 and 0.0 <= w <= 1.0 and 0.0 <= h <= 1.0):
-                    return False
-                ok_line = True
-        return ok_line
+        # Parse in C and range-check every coordinate in one vectorised pass;
+        # comments=None so '#' lines are rejected like any other malformed line
+        arr = np.loadtxt(data.splitlines(), ndmin=2, comments=None)
+        if arr.size == 0 or arr.shape[1] != 5 or not np.isfinite(arr[:, 0]).all():
+            return False
+        coords = arr[:, 1:5]
+        return bool(((coords >= 0.0) & (coords <= 1.0)).all())
     except Exception:
         return False
 
+class TokenBucket:
+    """Client-side rate limiter: refills `rate` tokens/s up to `burst`; acquire() waits for one token."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class AIMDLimiter:
+    """Concurrency limit with TCP-style AIMD: one more permit every `grow_every` successes, halved on throttling."""
+
+    def __init__(self, start: int, max_limit: int, grow_every: int = 10, cooldown: float = 1.0):
+        self.limit = max(1, min(start, max_limit))
+        self.max_limit = max_limit
+        self.grow_every = grow_every
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._successes = 0
+        self._last_shrink = 0.0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    async def grow(self):
+        async with self._cond:
+            self._successes += 1
+            if self._successes >= self.grow_every and self.limit < self.max_limit:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify()
+
+    async def shrink(self):
+        # A 429 burst fails many in-flight requests at once; only halve once per cooldown window
+        async with self._cond:
+            now = time.monotonic()
+            if now - self._last_shrink >= self.cooldown:
+                self.limit = max(1, int(self.limit * 0.5))
+                self._last_shrink = now
+            self._successes = 0
+
+class UploadError(Exception):
+    """Non-OK response from the Roboflow API, with the server's Retry-After delay if it sent one."""
+
+    def __init__(self, status: int, message: str, retry_after: float | None = None):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+        self.retry_after = retry_after
+
+def _is_backpressure(e: Exception) -> bool:
+    """429 / 5xx / dropped connections mean the server is overloaded: back off and retry."""
+    if isinstance(e, UploadError):
+        return e.status == 429 or e.status >= 500
+    return isinstance(e, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+def _retry_after(headers) -> float | None:
+    try:
+        return float(headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+async def _request_json(session, method: str, url: str, **kwargs):
+    async with session.request(method, url, **kwargs) as resp:
+        if resp.status != 200:
+            raise UploadError(resp.status, (await resp.text())[:200], _retry_after(resp.headers))
+        body = _loads(await resp.read())
+        if "error" in body:
+            raise UploadError(resp.status, str(body["error"]))
+        return body
+
+async def check_project(session, args):
+    """Fail fast on a bad API key or workspace/project slug, like the SDK's workspace().project() lookup."""
+    try:
+        await _request_json(session, "GET", f"{API_URL}/{args.workspace}/{args.project}", params={"api_key": args.api_key})
+    except (UploadError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise SystemExit(f"Could not open project '{args.workspace}/{args.project}': {e}")
+
+async def _upload_image(session, bucket, args, name: str, img_path: str, base_params) -> str:
+    """Upload one image through the Roboflow REST API and return its image id.
+
+    Raises UploadError or aiohttp errors on failure.
+    """
+    params = [*base_params, ("name", name)]
+    # Stream the JPEG from the open file instead of buffering it: aiohttp reads it in chunks
+    # and sizes the multipart body from fstat, so memory per in-flight upload stays flat
+    with open(img_path, "rb") as f:
+        form = aiohttp.FormData()
+        form.add_field("name", name)
+        form.add_field("file", f, filename=name, content_type="image/jpeg")
+        if bucket:
+            await bucket.acquire()
+        res = await _request_json(session, "POST", f"{API_URL}/dataset/{args.project}/upload", params=params, data=form)
+    return res["id"]
+
+async def _annotate(session, bucket, args, name: str, image_id: str, annotation: str):
+    """Attach a YOLO label to an already uploaded image (the REST API takes it in a second call)."""
+    if bucket:
+        await bucket.acquire()
+    await _request_json(
+        session,
+        "POST",
+        f"{API_URL}/dataset/{args.project}/annotate/{image_id}",
+        params={"api_key": args.api_key, "name": name[:-4] + ".txt"},
+        json={"annotationFile": annotation},
+    )
+
+async def upload_all(args, frames_dir: str, images, labels, batch_name: str, base_params) -> int:
+    """Validate and upload images in a producer/consumer pipeline under an AIMD concurrency limit.
+
+    `images` are file names inside `frames_dir`; `labels` maps image stems to label DirEntries.
+    Returns the number uploaded.
+    """
+    limiter = AIMDLimiter(args.concurrency, args.max_concurrency)
+    bucket = TokenBucket(args.rps, args.burst) if args.rps > 0 else None
+    queue = asyncio.Queue(maxsize=64)
+    n_workers = args.max_concurrency
+    done = uploaded = 0
+    total = len(images)
+    info_on = logging.getLogger().isEnabledFor(logging.INFO)
+
+    async def producer():
+        # Validate labels off the event loop, a queue-sized chunk at a time, so disk reads
+        # overlap with each other and with uploads already in flight
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            for start in range(0, len(images), queue.maxsize):
+                chunk = [(name, f"{frames_dir}/{name}", labels.get(name[:-4])) for name in images[start:start + queue.maxsize]]
+                valid = await asyncio.gather(*(loop.run_in_executor(pool, is_valid_yolo_txt, label) for _, _, label in chunk))
+                for (name, img_path, label), ann_ok in zip(chunk, valid):
+                    await queue.put((name, img_path, label, ann_ok))
+        for _ in range(n_workers):
+            await queue.put(None)
+
+    async def consumer(session):
+        while (job := await queue.get()) is not None:
+            await run_job(session, *job)
+
+    async def with_retries(name, call):
+        """Run `call()` under the limiter, retrying it on backpressure; re-raises the final error."""
+        for attempt in range(args.max_retries + 1):
+            try:
+                async with limiter:
+                    result = await call()
+            except Exception as e:
+                if not _is_backpressure(e) or attempt == args.max_retries:
+                    raise
+                # Back off outside the limiter so the slot goes to requests that may still succeed
+                await limiter.shrink()
+                delay = getattr(e, "retry_after", None) or 0.5 * 2 ** attempt
+                logging.warning(f"Throttled on {name} ({e}); concurrency={limiter.limit}, retry in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            else:
+                await limiter.grow()
+                return result
+
+    async def run_job(session, name, img_path, label, ann_ok):
+        nonlocal done, uploaded
+        if args.dry_run:
+            logging.info(f"[DRY] {name}  ann={'valid' if ann_ok else 'none'}  -> split={args.split} batch={batch_name}")
+        else:
+            try:
+                image_id = await with_retries(name, lambda: _upload_image(session, bucket, args, name, img_path, base_params))
+            except Exception as e:
+                logging.error(f"Upload failed for {name}: {e}")
+            else:
+                uploaded += 1
+                # The label step is retried on its own, so a throttled annotate never re-sends the image
+                if ann_ok:
+                    try:
+                        with open(label) as f:
+                            annotation = f.read()
+                        await with_retries(name, lambda: _annotate(session, bucket, args, name, image_id, annotation))
+                    except Exception as e:
+                        logging.error(f"Annotation failed for {name} (image uploaded as {image_id}): {e}")
+                elif label is not None:
+                    # A failed DirEntry.stat() isn't cached, so a label removed since the scan raises here
+                    try:
+                        if label.stat().st_size == 0:
+                            logging.debug(f"Skipped empty label for {name}")
+                    except OSError:
+                        pass
+        done += 1
+        if info_on and done % 100 == 0:
+            logging.info("Progress: %d/%d", done, total)
+
+    # One pooled session for all tasks: keep-alive connections amortise DNS + TCP + TLS over every upload
+    connector = aiohttp.TCPConnector(limit=args.max_concurrency, keepalive_timeout=60, ttl_dns_cache=300)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await check_project(session, args)
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(producer())
+            for _ in range(n_workers):
+                tg.create_task(consumer(session))
+    return uploaded
+
+def _regex(pattern: str) -> re.Pattern:
+    # argparse only turns ValueError/TypeError into usage errors, and re.error is neither
+    try:
+        return re.compile(pattern)
+    except re.error as e:
+        raise argparse.ArgumentTypeError(f"invalid regex {pattern!r}: {e}")
+
 def main():
     ap = argparse.ArgumentParser(description="Upload YOLO frames+labels from a run folder to Roboflow")
     ap.add_argument("--api_key", required=True, help="Roboflow API key")
@@ -48,10 +296,23 @@ def main():
     ap.add_argument("--run_dir", required=True, help="Path to run folder (…/YYYY-MM-DD/<tag>/runXX)")
     ap.add_argument("--split", default="train", choices=["train","valid","test"], help="Dataset split")
     ap.add_argument("--batch_name", default="", help="Optional Roboflow batch name")
+    ap.add_argument("--include", default="", help="Only upload frames whose file name matches this glob (e.g. 'frame_*0.jpg')")
+    ap.add_argument("--exclude", type=_regex, default=None, help="Skip frames whose file name matches this regex")
     ap.add_argument("--limit", type=int, default=0, help="Upload only first N images (0 = all)")
-    ap.add_argument("--sleep", type=float, default=0.0, help="Sleep seconds between uploads (avoid API bursts)")
+    ap.add_argument("--rps", type=float, default=0.0, help="Max API requests per second (0 = unlimited)")
+    ap.add_argument("--burst", type=int, default=4, help="Requests allowed back-to-back before --rps kicks in")
+    ap.add_argument("--concurrency", type=int, default=16, help="Initial uploads in flight at once (adapted with AIMD)")
+    ap.add_argument("--max_concurrency", type=int, default=64, help="Upper bound for the adaptive concurrency")
+    ap.add_argument("--max_retries", type=int, default=5, help="Retries per image on 429 / 5xx / connection errors")
+    ap.add_argument("--include_meta_tags", action="store_true", help="Also tag uploads with scalar key:value pairs from meta.json")
     ap.add_argument("--dry_run", action="store_true", help="List what would be uploaded, do not send")
     args = ap.parse_args()
+    if args.burst < 1:
+        ap.error("--burst must be >= 1")
+    if args.concurrency < 1 or args.max_concurrency < 1:
+        ap.error("--concurrency and --max_concurrency must be >= 1")
+    if args.max_retries < 0:
+        ap.error("--max_retries must be >= 0")
 
     logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
@@ -65,59 +326,53 @@ def main():
     if not labels_dir.is_dir():
         logging.warning("Labels folder not found; proceeding with images only (no annotations).")
 
-    # derive tags from folder structure + meta.json
+    # derive tags from folder structure (+ meta.json only when asked for; otherwise it is never read)
     date, tag, run = infer_run_parts(run_dir)
     meta = {}
-    if meta_path.exists():
+    if args.include_meta_tags and meta_path.exists():
         try:
-            meta = json.loads(meta_path.read_text())
+            meta = _loads(meta_path.read_bytes())
+            if not isinstance(meta, dict):
+                raise ValueError(f"expected a JSON object at top level, got {type(meta).__name__}")
         except Exception as e:
             logging.warning(f"Could not parse meta.json: {e}")
+            meta = {}
 
     # set batch name default if not provided
     batch_name = args.batch_name or f"{date}_{tag}_{run}"
 
-    # Connect to Roboflow
-    rf = Roboflow(api_key=args.api_key)
-    project = rf.workspace(args.workspace).project(args.project)
+    # Query params shared by every upload; only the image name varies per request
+    tag_names = [f"date:{date}", f"tag:{tag}", f"run:{run}"]
+    tag_names += [f"{k}:{v}" for k, v in meta.items() if isinstance(v, (str, int, float, bool))]
+    base_params = [
+        ("api_key", args.api_key),
+        ("split", args.split),
+        ("batch", batch_name),
+        *[("tag", t) for t in tag_names],
+    ]
+
     logging.info(f"Uploading to workspace='{args.workspace}', project='{args.project}', split='{args.split}', batch='{batch_name}'")
 
-    # Collect images (.jpg only; extend here if you also save .png)
-    images = sorted(frames_dir.glob("*.jpg"))
+    # Collect images (.jpg only; extend here if you also save .png) and pair labels by stem:
+    # one scandir per folder instead of a glob plus a stat per image. Only names are kept
+    # (no Path objects); full paths are joined when each image is queued
+    # --include/--exclude are compiled once and applied during the scan, so rejected frames are never validated or sent
+    include = re.compile(fnmatch.translate(args.include)) if args.include else None
+    exclude = args.exclude
+    images = [
+        e.name for e in os.scandir(frames_dir)
+        if e.name.endswith(".jpg")
+        and (include is None or include.match(e.name))
+        and (exclude is None or not exclude.search(e.name))
+    ]
+    labels = {e.name[:-4]: e for e in os.scandir(labels_dir) if e.name.endswith(".txt")} if labels_dir.is_dir() else {}
     if args.limit > 0:
-        images = images[:args.limit]
-
-    # Upload loop
-    uploaded = 0
-    for i, img_path in enumerate(images, 1):
-        label_path = (labels_dir / (img_path.stem + ".txt"))
-        ann_ok = is_valid_yolo_txt(label_path)
-        annotation_path = str(label_path) if ann_ok else None
-
-        # Roboflow supports sending paired annotations; if None, uploads image only.
-        kwargs = {
-            "image_path": str(img_path),
-            "annotation_path": annotation_path,  # None -> image-only upload
-            "split": args.split,
-            "batch_name": batch_name,
-            "tag_names": [f"date:{date}", f"tag:{tag}", f"run:{run}"]
-        }
-
-        if args.dry_run:
-            logging.info(f"[DRY] {img_path.name}  ann={'valid' if ann_ok else 'none'}  -> split={args.split} batch={batch_name}")
-        else:
-            try:
-                project.upload(**kwargs)  # image + (optional) YOLO label
-                uploaded += 1
-                if not ann_ok and label_path.exists() and label_path.stat().st_size == 0:
-                    logging.debug(f"Skipped empty label for {img_path.name}")
-                if args.sleep > 0:
-                    time.sleep(args.sleep)
-            except Exception as e:
-                logging.error(f"Upload failed for {img_path.name}: {e}")
+        images = heapq.nsmallest(args.limit, images)
+    else:
+        images.sort()
 
-        if i % 100 == 0:
-            logging.info(f"Progress: {i}/{len(images)}")
+    # Validate and upload concurrently; the workload is network-bound, so requests overlap on one event loop
+    uploaded = asyncio.run(upload_all(args, str(frames_dir), images, labels, batch_name, base_params))
 
     logging.info(f"Done. Uploaded {uploaded}/{len(images)} images to {args.split} (batch: {batch_name}).")
 